@@ -1,7 +1,25 @@
 import unified_planning as up
 import unified_planning.shortcuts
 import functools
-import operator
+import itertools
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+
+def _cache_per_action(method):
+    """
+    Caches the result of `method` per action name.
+    It is used on the original problem actions, whose effects are not changed by the conversion
+    """
+    @functools.wraps(method)
+    def wrapper(self, action):
+        key = (method.__name__, action.name)
+        res = self._assignments_cache.get(key)
+        if res is None:
+            res = method(self, action)
+            self._assignments_cache[key] = res
+        return res
+    return wrapper
 
 
 class Convert_problem:
@@ -18,10 +36,23 @@ class Convert_problem:
         self._inExecution: "up.model.Fluent" = up.model.Fluent('inExecution', up.shortcuts.BoolType(),
                                                                a=self._action_type)
         self._grounded_actions = []
+        # effects of the original actions, indexed by the fluents they assign (used to find mutex actions)
+        self._assignments_cache: Dict[Tuple[str, str], FrozenSet["up.model.fnode.FNode"]] = {}
+        self._all_effects_cache: Dict[str, Tuple[Set["up.model.fnode.FNode"], Set["up.model.fnode.FNode"]]] = {}
+        self._fluent_to_neg_start_acts: Dict["up.model.fnode.FNode", List[int]] = defaultdict(list)
+        self._fluent_to_pos_start_acts: Dict["up.model.fnode.FNode", List[int]] = defaultdict(list)
+        self._fluent_to_neg_end_acts: Dict["up.model.fnode.FNode", List[int]] = defaultdict(list)
+        self._fluent_to_pos_end_acts: Dict["up.model.fnode.FNode", List[int]] = defaultdict(list)
+        self._action_by_name: Dict[str, "up.engines.Action"] = {}
+        self._object_by_name: Dict[str, "up.model.Object"] = {}
+        # splitting and mutex detection only concern durative actions
+        self._has_durative = any(isinstance(a, up.model.DurativeAction) for a in self._original_problem._actions)
         self._add_inExecution_fluent()
-        self._split_durative_actions()
+        if self._has_durative:
+            self._split_durative_actions()
         self._convert_model_engine_actions()
-        self._mutex_actions()
+        if self._has_durative:
+            self._mutex_actions()
 
     def __repr__(self) -> str:
         return self._converted_problem.__repr__()
@@ -65,6 +96,9 @@ class Convert_problem:
         Probabilistic Effects: the probabilistic effects of the original action
 
         """
+        kept_actions = []
+        new_actions = []
+        new_objects = []
         for action in self._converted_problem._actions:
 
             if isinstance(action, up.model.DurativeAction):
@@ -105,14 +139,19 @@ class Convert_problem:
 
                 end_action.add_precondition(self._inExecution(object_start), True)
 
-                # Add to the problem the actions and the start action object
-                self._converted_problem.add_object(object_start)
-                self._converted_problem.add_action(start_action)
-                self._converted_problem.add_action(end_action)
+                new_objects.append(object_start)
+                new_actions.append(start_action)
+                new_actions.append(end_action)
+
+            else:
+                kept_actions.append(action)
 
-        # remove the durative actions and model.InstantaneousAction
-        self._converted_problem._actions = [a for a in self._converted_problem._actions if
-                                            not isinstance(a, up.model.DurativeAction)]
+        # Replace the durative actions by the start and end actions and add the start action objects in one go.
+        # The new names are unique since they are derived from the unique names of the durative actions
+        self._converted_problem._actions = kept_actions + new_actions
+        if new_objects:
+            self._converted_problem._objects.extend(new_objects)
+            self._converted_problem._add_user_type_method(self._action_type)
 
     def _convert_model_engine_actions(self):
         """
@@ -148,41 +187,102 @@ class Convert_problem:
 
         A precondition inExecution(start_action) is added to the conflicting mutex action
         """
-        for action in self._original_problem._actions:
-            # soft = []
-            # mutex = []
+        self._action_by_name = {a.name: a for a in self._converted_problem._actions}
+        self._object_by_name = {o.name: o for o in self._converted_problem.all_objects}
+        self._set_effects_sign()
+        self._index_actions_effects()
+        actions = self._original_problem._actions
 
+        for action in actions:
             if isinstance(action, up.model.DurativeAction):
-                for potential_action in self._original_problem._actions:
-                    if potential_action == action:
+                for i in self._mutex_candidates(action):
+                    potential_action = actions[i]
+                    if potential_action is action:
                         continue
                     if self._check_mutex(action, potential_action):
                         self._adding_precondition_mutex_actions(action, potential_action)
-                        # mutex.append(potential_action.name)
                     if self._check_soft_mutex(action, potential_action):
                         self._adding_precondition_soft_mutex_actions(action, potential_action)
 
                         if isinstance(potential_action, up.model.DurativeAction):
                             if action.duration_int() > potential_action.duration_int():
                                 self._adding_precondition_mutex_actions(potential_action, action)
-                        # self._adding_time_mutex_actions(action, potential_action)
 
+    def _set_effects_sign(self):
+        """
+        Stores on each effect and OVERALL precondition of the original actions whether it assigns true,
+        so the mutex checks don't evaluate the value expression again for every pair of actions
+        """
+        for action in self._original_problem._actions:
+            for e in itertools.chain(action.effects, getattr(action, 'start_effects', ())):
+                e._is_positive = bool(e.value.constant_value())
+            if isinstance(action, up.model.DurativeAction):
+                for p in action.preconditions.get('OVERALL', ()):
+                    p._is_positive = bool(p.value.constant_value())
 
-                        # soft.append(potential_action.name)
+    def _index_actions_effects(self):
+        """
+        Caches the effects of each original action and
+        indexes for each fluent the actions whose start / end effects assign it
+        """
+        for i, action in enumerate(self._original_problem._actions):
+            neg_start = self._negative_start_assignment(action)
+            pos_start = self._positive_start_assignment(action)
+            neg_end = self._negative_end_assignment(action)
+            pos_end = self._positive_end_assignment(action)
+
+            self._all_effects_cache[action.name] = (neg_start | neg_end, pos_start | pos_end)
+
+            for f in neg_start:
+                self._fluent_to_neg_start_acts[f].append(i)
+            for f in pos_start:
+                self._fluent_to_pos_start_acts[f].append(i)
+            for f in neg_end:
+                self._fluent_to_neg_end_acts[f].append(i)
+            for f in pos_end:
+                self._fluent_to_pos_end_acts[f].append(i)
+
+    def _mutex_candidates(self, action):
+        """
+        Uses the fluents index to find the actions that can be mutex or soft mutex with `action`:
+        actions with an effect conflicting with the effects of `action`
+        or with an effect conflicting with an OVERALL precondition of `action`
+
+        :return: the indexes of the candidate actions, in the order of the original problem actions
+        """
+        neg_effect, pos_effect = self.all_effects(action)
+        candidates = set()
+
+        for f in pos_effect:
+            candidates.update(self._fluent_to_neg_start_acts.get(f, ()))
+            candidates.update(self._fluent_to_neg_end_acts.get(f, ()))
+        for f in neg_effect:
+            candidates.update(self._fluent_to_pos_start_acts.get(f, ()))
+            candidates.update(self._fluent_to_pos_end_acts.get(f, ()))
 
-                # print(f'action {action.name} is mutex with: {mutex}')
-                # print(f'action {action.name} is soft mutex with: {soft}')
+        for p in action.preconditions.get('OVERALL', []):
+            if p._is_positive:
+                candidates.update(self._fluent_to_neg_start_acts.get(p.fluent, ()))
+                candidates.update(self._fluent_to_neg_end_acts.get(p.fluent, ()))
+            else:
+                candidates.update(self._fluent_to_pos_start_acts.get(p.fluent, ()))
+                candidates.update(self._fluent_to_pos_end_acts.get(p.fluent, ()))
 
+        return sorted(candidates)
 
     def all_effects(self, action):
+        cached = self._all_effects_cache.get(action.name)
+        if cached is not None:
+            return cached
+
         neg_start = self._negative_start_assignment(action)
         pos_start = self._positive_start_assignment(action)
 
         neg_end = self._negative_end_assignment(action)
         pos_end = self._positive_end_assignment(action)
 
-        neg_effect = set(neg_start + neg_end)
-        pos_effect = set(pos_start + pos_end)
+        neg_effect = neg_start | neg_end
+        pos_effect = pos_start | pos_end
 
         return neg_effect, pos_effect
 
@@ -210,8 +310,8 @@ class Convert_problem:
         neg = self._negative_start_assignment(potential_action)
         pos = self._positive_start_assignment(potential_action)
 
-        neg_mutex = any(x.fluent in neg and x.value.constant_value() for x in action.preconditions['OVERALL'])
-        pos_mutex = any(x.fluent in pos and not x.value.constant_value() for x in action.preconditions['OVERALL'])
+        neg_mutex = any(x.fluent in neg and x._is_positive for x in action.preconditions['OVERALL'])
+        pos_mutex = any(x.fluent in pos and not x._is_positive for x in action.preconditions['OVERALL'])
 
         if neg_mutex or pos_mutex:
             return True
@@ -233,14 +333,15 @@ class Convert_problem:
         neg = self._negative_end_assignment(potential_action)
         pos = self._positive_end_assignment(potential_action)
 
-        neg_mutex = any(x.fluent in neg and x.value.constant_value() for x in action.preconditions['OVERALL'])
-        pos_mutex = any(x.fluent in pos and not x.value.constant_value() for x in action.preconditions['OVERALL'])
+        neg_mutex = any(x.fluent in neg and x._is_positive for x in action.preconditions['OVERALL'])
+        pos_mutex = any(x.fluent in pos and not x._is_positive for x in action.preconditions['OVERALL'])
 
         if neg_mutex or pos_mutex:
             return True
 
         return False
 
+    @_cache_per_action
     def _negative_end_assignment(self, action):
         """
         returns all the negative end assignments of durative `action` to fluents in
@@ -249,12 +350,13 @@ class Convert_problem:
         :param action: an action instance
         :return: The negative end assignments of the actions
         """
-        neg = []
         if isinstance(action, up.model.DurativeAction):
-            neg += [e.fluent for e in action.effects if not e.value.constant_value()]
-            neg += functools.reduce(operator.iconcat, [pe.fluents for pe in action.probabilistic_effects], [])
-        return neg
+            return frozenset(itertools.chain(
+                (e.fluent for e in action.effects if not e._is_positive),
+                itertools.chain.from_iterable(pe.fluents for pe in action.probabilistic_effects)))
+        return frozenset()
 
+    @_cache_per_action
     def _negative_start_assignment(self, action):
         """
         returns all the negative start assignments of `action` to fluents in
@@ -264,14 +366,13 @@ class Convert_problem:
         :param action: an action instance
         :return: The negative start assignments of the actions
         """
-        neg = []
         if isinstance(action, up.model.DurativeAction):
-            neg += [de.fluent for de in action.start_effects if not de.value.constant_value()]
-        else:
-            neg += [e.fluent for e in action.effects if not e.value.constant_value()]
-            neg += functools.reduce(operator.iconcat, [pe.fluents for pe in action.probabilistic_effects], [])
-        return neg
+            return frozenset(de.fluent for de in action.start_effects if not de._is_positive)
+        return frozenset(itertools.chain(
+            (e.fluent for e in action.effects if not e._is_positive),
+            itertools.chain.from_iterable(pe.fluents for pe in action.probabilistic_effects)))
 
+    @_cache_per_action
     def _positive_start_assignment(self, action):
         """
         returns all the positive start assignments of `action` to fluents
@@ -281,14 +382,13 @@ class Convert_problem:
         :param action: an action instance
         :return: The positive start assignments of the actions
         """
-        pos = []
         if isinstance(action, up.model.DurativeAction):
-            pos += [de.fluent for de in action.start_effects if de.value.constant_value()]
-        else:
-            pos += [e.fluent for e in action.effects if e.value.constant_value()]
-            pos += functools.reduce(operator.iconcat, [pe.fluents for pe in action.probabilistic_effects], [])
-        return pos
+            return frozenset(de.fluent for de in action.start_effects if de._is_positive)
+        return frozenset(itertools.chain(
+            (e.fluent for e in action.effects if e._is_positive),
+            itertools.chain.from_iterable(pe.fluents for pe in action.probabilistic_effects)))
 
+    @_cache_per_action
     def _positive_end_assignment(self, action):
         """
         returns all the positive end assignments of durative `action` to fluents in
@@ -297,11 +397,11 @@ class Convert_problem:
         :param action: an action instance
         :return: The positive assignment of the actions in effects and during effects
         """
-        pos = []
         if isinstance(action, up.model.DurativeAction):
-            pos += [e.fluent for e in action.effects if e.value.constant_value()]
-            pos += functools.reduce(operator.iconcat, [pe.fluents for pe in action.probabilistic_effects], [])
-        return pos
+            return frozenset(itertools.chain(
+                (e.fluent for e in action.effects if e._is_positive),
+                itertools.chain.from_iterable(pe.fluents for pe in action.probabilistic_effects)))
+        return frozenset()
 
     def _adding_precondition_mutex_actions(self, action, conflicting_action):
         """
@@ -312,14 +412,14 @@ class Convert_problem:
         :param action:
         :param conflicting_action: The action is mutexed to `action`
         """
-        start_action_object = self._converted_problem.object_by_name('start-' + action.name)
+        start_action_object = self._object_by_name['start-' + action.name]
 
         if isinstance(conflicting_action, up.model.DurativeAction):
-            start_conflicting_action = self._converted_problem.action_by_name("start_" + conflicting_action.name)
+            start_conflicting_action = self._action_by_name["start_" + conflicting_action.name]
             start_conflicting_action.add_precondition(self._inExecution(start_action_object), False)
 
         else:
-            conflicting_action = self._converted_problem.action_by_name(conflicting_action.name)
+            conflicting_action = self._action_by_name[conflicting_action.name]
             conflicting_action.add_precondition(self._inExecution(start_action_object), False)
 
     def _adding_precondition_soft_mutex_actions(self, action, conflicting_action):
@@ -332,9 +432,9 @@ class Convert_problem:
         :param conflicting_action: The action is soft mutexed to `action`
         """
 
-        start_action_object = self._converted_problem.object_by_name('start-' + action.name)
+        start_action_object = self._object_by_name['start-' + action.name]
 
-        end_conflicting_action = self._converted_problem.action_by_name("end_" + conflicting_action.name)
+        end_conflicting_action = self._action_by_name["end_" + conflicting_action.name]
         end_conflicting_action.add_precondition(self._inExecution(start_action_object), False)
 
 
@@ -362,9 +462,9 @@ class Convert_problem:
         if isinstance(conflicting_action, up.model.DurativeAction):
             if action.duration_int() > conflicting_action.duration_int():
 
-                start_conflicting_action_object = self._converted_problem.object_by_name('start-' + conflicting_action.name)
+                start_conflicting_action_object = self._object_by_name['start-' + conflicting_action.name]
 
-                start_action = self._converted_problem.action_by_name("start_" + action.name)
+                start_action = self._action_by_name["start_" + action.name]
                 start_action.add_precondition(self._inExecution(start_conflicting_action_object), False)
 
 
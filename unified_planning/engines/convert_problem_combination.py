@@ -1,7 +1,5 @@
 import unified_planning as up
 import unified_planning.shortcuts
-import functools
-import operator
 import itertools
 
 
@@ -208,14 +206,14 @@ class Convert_problem_combination:
                 potential_action.pos_preconditions.intersection(action.neg_preconditions)) > 0:
             return True
 
-        probabilistic = functools.reduce(operator.iconcat, [pe.fluents for pe in action.probabilistic_effects], [])
-        potential_probabilistic = functools.reduce(operator.iconcat,
-                                                   [pe.fluents for pe in potential_action.probabilistic_effects], [])
+        probabilistic = set(itertools.chain.from_iterable(pe.fluents for pe in action.probabilistic_effects))
+        potential_probabilistic = set(
+            itertools.chain.from_iterable(pe.fluents for pe in potential_action.probabilistic_effects))
 
-        neg_potential_effect = potential_action.del_effects.union(set(potential_probabilistic))
-        pos_potential_effect = potential_action.add_effects.union(set(potential_probabilistic))
-        neg_effect = action.del_effects.union(set(probabilistic))
-        pos_effect = action.add_effects.union(set(probabilistic))
+        neg_potential_effect = potential_action.del_effects.union(potential_probabilistic)
+        pos_potential_effect = potential_action.add_effects.union(potential_probabilistic)
+        neg_effect = action.del_effects.union(probabilistic)
+        pos_effect = action.add_effects.union(probabilistic)
 
         # Check conflicting outcomes
         if len(neg_potential_effect.intersection(pos_effect)) > 0 or len(
@@ -1,6 +1,7 @@
-from unified_planning.engines.heuristics.trpg import TRPG
+from unified_planning.engines.heuristics.trpg import TRPG, TRPG_Compiled
 
 
 __all__ = [
     "TRPG",
+    "TRPG_Compiled",
 ]
\ No newline at end of file
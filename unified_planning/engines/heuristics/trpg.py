@@ -5,15 +5,54 @@ from typing import Dict
 import numpy as np
 
 
+class TRPG_Compiled:
+    """
+    The parts of the TRPG that depend only on the MDP and not on the evaluated state,
+    computed once and shared by the evaluations of all the states
+    """
+
+    def __init__(self, mdp: "up.engines.MDP"):
+        self.mdp = mdp
+        self.fluents = frozenset(mdp.problem.initial_values.keys())
+        self.deadline = mdp.deadline() if mdp.deadline() else math.inf
+
+        # The actions are keyed by their id, hashing an action is costly
+        self.end_actions = []
+        # The inExecution fluent of the start action of each end action
+        self.inExecution: Dict[int, "up.model.FNode"] = {}
+        # The duration of each start action, and of the start action of each end action
+        self.durations: Dict[int, int] = {}
+        for action in mdp.problem.actions:
+            if isinstance(action, up.engines.InstantaneousEndAction):
+                inExecution = mdp.problem.fluent_by_name('inExecution')
+                action_object = mdp.problem.object_by_name(f'start-{action.name[4:]}')
+                self.end_actions.append(action)
+                self.inExecution[id(action)] = inExecution(action_object)
+                self.durations[id(action)] = action.start_action.duration_int()
+            elif isinstance(action, up.engines.InstantaneousStartAction):
+                self.durations[id(action)] = action.duration_int()
+
+    def evaluate(self, state: "up.engines.State", current_time: int, lower_bounds=None):
+        """ Calculates the heuristic of `state` at `current_time` """
+        return TRPG(self.mdp, state, current_time, self).get_heuristic(lower_bounds)
+
+
 class TRPG:
 
-    def __init__(self, mdp: "up.engines.MDP", state: "up.engines.State", current_time: int):
+    def __init__(self, mdp: "up.engines.MDP", state: "up.engines.State", current_time: int,
+                 compiled: TRPG_Compiled = None):
+        if compiled is None:
+            compiled = TRPG_Compiled(mdp)
         self.mdp = mdp
-        self.negative = set(mdp.problem.initial_values.keys()).difference(state.predicates)
+        self.compiled = compiled
+        self.negative = compiled.fluents.difference(state.predicates)
         self.positive = set(state.predicates)
         self.new_actions = []
         self.legal_probabilistic_actions = []
-        self.deadline = self.mdp.deadline() if self.mdp.deadline() else math.inf
+        # The ids of `new_actions` and `legal_probabilistic_actions`
+        self.new_ids = set()
+        self.probabilistic_ids = set()
+        self.deadline = compiled.deadline
         self.current_time = current_time
 
     def get_heuristic(self, lower_bounds=None):
@@ -22,6 +61,7 @@ class TRPG:
         """
         t = self.current_time
         earliest = self.init_actions(lower_bounds)
+        durations = self.compiled.durations
 
         while t <= self.deadline and not self.mdp.problem.goals.issubset(self.positive):
             negative_eps = set(self.negative)
@@ -30,8 +70,8 @@ class TRPG:
             for action in self.legal_probabilistic_actions:
                 perform = True
                 if isinstance(action, up.engines.InstantaneousEndAction):
-                    if earliest[action] <= t:
-                        earliest[action] = t + action.start_action.duration.lower.int_constant_value()
+                    if earliest[id(action)] <= t:
+                        earliest[id(action)] = t + durations[id(action)]
                     else:
                         perform = False
                 if perform:
@@ -41,7 +81,7 @@ class TRPG:
 
                 # end action can occur only after `earliest[action]` time
                 if isinstance(action, up.engines.InstantaneousEndAction):
-                    if earliest[action] > t:
+                    if earliest[id(action)] > t:
                         continue
 
                 # Checks if the preconditions of the action are held
@@ -52,27 +92,32 @@ class TRPG:
 
                 # Sets the time when the end action can be executed
                 if isinstance(action, up.engines.InstantaneousStartAction):
-                    earliest[action.end_action] = min(earliest.get(action.end_action),
-                                                      t + action.duration.lower.int_constant_value())
+                    earliest[id(action.end_action)] = min(earliest.get(id(action.end_action)),
+                                                          t + durations[id(action)])
 
                 # add the effects of the action to the next state
                 self.add_effects(action, negative_eps, positive_eps)
 
-                self.new_actions.remove(action)
+                self.new_ids.discard(id(action))
 
                 if action.probabilistic_effects:
                     self.legal_probabilistic_actions.append(action)
+                    self.probabilistic_ids.add(id(action))
                     # The next time the end action can be executed is after the duration time
                     if isinstance(action, up.engines.InstantaneousEndAction):
-                        earliest[action] = t + action.start_action.duration_int()
+                        earliest[id(action)] = t + durations[id(action)]
+
+            if len(self.new_ids) < len(self.new_actions):
+                self.new_actions = [a for a in self.new_actions if id(a) in self.new_ids]
 
             # advance the time
             if len(negative_eps.difference(self.negative)) > 0 or len(positive_eps.difference(self.positive)) > 0:
                 self.negative = negative_eps
                 self.positive = positive_eps
             else:
-                endpoints = [earliest.get(a) for a in earliest.keys() if self.legal_action(a) and a in self.new_actions]
-                endpoints += [earliest.get(a) for a in earliest.keys() if a in self.legal_probabilistic_actions]
+                end_actions = self.compiled.end_actions
+                endpoints = [earliest[id(a)] for a in end_actions if id(a) in self.new_ids and self.legal_action(a)]
+                endpoints += [earliest[id(a)] for a in end_actions if id(a) in self.probabilistic_ids]
                 if endpoints:
                     t = min(endpoints)
                 else:
@@ -120,25 +165,24 @@ class TRPG:
         Init all actions into the new actions list
         ensures the end actions can be performed only after the start actions.
 
-        :return: earliest - a dictionary containing the earliest time each end action can be executed
+        :return: earliest - a dictionary containing the earliest time each end action can be executed, by the action id
         """
 
         earliest = {}
-        inExecution = self.mdp.problem.fluent_by_name('inExecution')
+        inExecution = self.compiled.inExecution
 
         for action in self.mdp.problem.actions:
             self.new_actions.append(action)
+            self.new_ids.add(id(action))
 
             # Makes sure end action can start only after the start action is performed
             if isinstance(action, up.engines.InstantaneousEndAction):
-                action_object = self.mdp.problem.object_by_name(f'start-{action.name[4:]}')
-
-                if not inExecution(action_object) in self.positive:
-                    earliest[action] = math.inf
+                if not inExecution[id(action)] in self.positive:
+                    earliest[id(action)] = math.inf
                 elif lower_bounds is None:
-                    earliest[action] = self.current_time
+                    earliest[id(action)] = self.current_time
                 else:
-                    earliest[action] = lower_bounds[action]
+                    earliest[id(action)] = lower_bounds[action]
 
                 # earliest[action] = self.current_time if inExecution(action_object) in self.positive else math.inf
 
@@ -1,15 +1,66 @@
-from typing import List
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
 
 import unified_planning as up
 import numpy as np
 from unified_planning.exceptions import UPPreconditionDonHoldException
 from itertools import product
 
+# The maximal amount of (probabilistic effect, state) outcome distributions kept in memory
+OUTCOMES_CACHE_SIZE = 100000
+# The maximal amount of states whose legal actions are kept in memory
+LEGAL_ACTIONS_CACHE_SIZE = 65536
+# The amount of uniform samples drawn from the random generator at once
+RNG_BUFFER_SIZE = 1 << 14
+# The maximal amount of interned states kept in memory
+STATE_POOL_SIZE = 1 << 18
+
+
+def _alias_table(probabilities: np.ndarray):
+    """
+    Builds the tables of Walker's alias method (Vose's variant), to draw from `probabilities` in O(1)
+
+    :return: for each column, the probability to keep the column and the column it is aliased to otherwise
+    """
+    k = len(probabilities)
+    scaled = list(probabilities * k)
+    keep = [1.0] * k
+    alias = list(range(k))
+    small = [i for i, p in enumerate(scaled) if p < 1]
+    large = [i for i, p in enumerate(scaled) if p >= 1]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        keep[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = scaled[l] + scaled[s] - 1
+        if scaled[l] < 1:
+            small.append(l)
+        else:
+            large.append(l)
+    return keep, alias
+
 
 class MDP:
     def __init__(self, problem: "up.model.problem.Preoblem", discount_factor: float):
         self._problem = problem
         self._discount_factor = discount_factor
+        self._fluent_id: Dict["up.model.fnode.FNode", int] = {}
+        self._id_fluent: List["up.model.fnode.FNode"] = []
+        self._assign_fluent_ids()
+        self._set_actions_masks()
+        self._goal_mask = self.fluents_mask(self.problem.goals)
+        self._initial_bits = self.fluents_mask(
+            [key for key, value in self.problem.initial_values.items() if value.bool_constant_value()])
+        self._actions = [a for a in self.problem.actions if not isinstance(a, up.engines.NoOpAction)]
+        self._legal_table = self._create_legal_table()
+        self._rng = np.random.default_rng()
+        self._rng_buf = self._rng.random(RNG_BUFFER_SIZE)
+        self._rng_i = 0
+        self._draws = 0
+        self._outcomes_cache: "OrderedDict[Tuple[int, int], Tuple[np.ndarray, Tuple]]" = OrderedDict()
+        self._legal_cache: "OrderedDict[int, List[up.engines.Action]]" = OrderedDict()
+        self._state_pool: "OrderedDict[int, up.engines.State]" = OrderedDict()
 
     @property
     def problem(self):
@@ -19,17 +70,112 @@ class MDP:
     def discount_factor(self):
         return self._discount_factor
 
+    @property
+    def draws(self):
+        """ The amount of uniform samples drawn so far, a `step` that draws none is deterministic """
+        return self._draws
+
     def deadline(self):
         return self.problem.deadline
 
+    def _assign_fluent_ids(self):
+        """
+        Numbers every ground fluent of the problem 0..F-1,
+        the fluent with id i is represented by the i-th bit of a state
+        """
+        fluents = list(self.problem.initial_values.keys())
+        fluents += self.problem.goals
+        for action in self.problem.actions:
+            fluents += getattr(action, 'pos_preconditions', ())
+            fluents += getattr(action, 'neg_preconditions', ())
+            fluents += getattr(action, 'add_effects', ())
+            fluents += getattr(action, 'del_effects', ())
+            fluents += getattr(action, 'inExecution', ())
+            for pe in getattr(action, 'probabilistic_effects', ()):
+                fluents += pe.fluents
+
+        for f in fluents:
+            self._fluent_bit(f)
+
+    def _fluent_bit(self, fluent: "up.model.fnode.FNode"):
+        """ Returns the bit of `fluent`, a new id is given to a fluent that was not seen before """
+        fluent_id = self._fluent_id.get(fluent)
+        if fluent_id is None:
+            fluent_id = len(self._id_fluent)
+            self._fluent_id[fluent] = fluent_id
+            self._id_fluent.append(fluent)
+        return 1 << fluent_id
+
+    def fluents_mask(self, fluents: Iterable["up.model.fnode.FNode"]):
+        """ Returns the bitmask of the `fluents` """
+        mask = 0
+        for f in fluents:
+            mask |= self._fluent_bit(f)
+        return mask
+
+    def _set_actions_masks(self):
+        """
+        Precompute the bitmasks of the preconditions and effects of each action.
+        The masks are relative to the fluent ids of this MDP.
+        """
+        for action in self.problem.actions:
+            action.pos_mask = self.fluents_mask(getattr(action, 'pos_preconditions', ()))
+            action.neg_mask = self.fluents_mask(getattr(action, 'neg_preconditions', ()))
+            action.add_mask = self.fluents_mask(getattr(action, 'add_effects', ()))
+            action.del_mask = self.fluents_mask(getattr(action, 'del_effects', ()))
+            action.inExecution_mask = self.fluents_mask(getattr(action, 'inExecution', ()))
+
+            if isinstance(action, up.engines.DurativeAction):
+                action._duration_int = action.duration.lower.int_constant_value()
+            elif isinstance(action, up.engines.CombinationAction):
+                for a in action.actions:
+                    a._duration_int = a.duration.lower.int_constant_value()
+
+            if isinstance(action, up.engines.InstantaneousStartAction):
+                # The start action is not relevant if all its effects (apart from inExecution)
+                # and the effects of its end action already hold in the state
+                inExecution = self.problem.fluent_by_name('inExecution')
+                add = [e for e in action.add_effects if e._content.payload != inExecution]
+                for pe in action.end_action.probabilistic_effects:
+                    add += pe.fluents
+                action.not_relevant_pos_mask = self.fluents_mask(add) | self.fluents_mask(action.end_action.add_effects)
+                action.not_relevant_neg_mask = self.fluents_mask(action.end_action.del_effects)
+
+    def _create_legal_table(self):
+        """
+        Flattens the masks `legal_actions` needs into one table of
+        (pos_mask, neg_mask, not_relevant_pos_mask, not_relevant_neg_mask, action) rows.
+        Actions that are always relevant get not_relevant_pos_mask = -1, which no state contains.
+        """
+        table = []
+        for a in self._actions:
+            if isinstance(a, up.engines.InstantaneousStartAction):
+                table.append((a.pos_mask, a.neg_mask, a.not_relevant_pos_mask, a.not_relevant_neg_mask, a))
+            else:
+                table.append((a.pos_mask, a.neg_mask, -1, 0, a))
+        return table
+
+    def _state(self, bits: int):
+        """
+        Returns the state of `bits`, states are interned so equal states are usually the same object
+        and share their decoded predicates
+        """
+        state = self._state_pool.get(bits)
+        if state is None:
+            state = up.engines.State(bits=bits, fluents=self._id_fluent)
+            self._state_pool[bits] = state
+            if len(self._state_pool) > STATE_POOL_SIZE:
+                self._state_pool.popitem(last=False)
+        else:
+            self._state_pool.move_to_end(bits)
+        return state
+
     def initial_state(self):
         """
 
         :return: the initial state of the problem
         """
-        predicates = self.problem.initial_values
-        pos_predicates = set([key for key, value in predicates.items() if value.bool_constant_value()])
-        return up.engines.State(pos_predicates)
+        return self._state(self._initial_bits)
 
     def is_terminal(self, state: "up.engines.state.State"):
         """
@@ -39,7 +185,7 @@ class MDP:
         :return: True is the `state` is a terminal state, False otherwise
         """
 
-        return self.problem.goals.issubset(state.predicates)
+        return (state.bits & self._goal_mask) == self._goal_mask
 
     def legal_actions(self, state: "up.engines.state.State"):
         """
@@ -48,40 +194,39 @@ class MDP:
         The action is considered legal for the state
 
         :param state: the current state of the system
-        :return: the legal actions that can be preformed in the state `state`
+        :return: the legal actions that can be preformed in the state `state`,
+                 the returned list is shared between calls and must not be modified
         """
 
-        legal_actions = []
-        for action in self.problem.actions:
-            if isinstance(action, up.engines.NoOpAction):
-               continue
-            if action.pos_preconditions.issubset(state.predicates) and \
-                    action.neg_preconditions.isdisjoint(state.predicates):
-                if self.check_action_relevant(state, action):
-                    # prone action that don't add new effects
-                    legal_actions.append(action)
-
-        return legal_actions
+        bits = state.bits
+        legal = self._legal_cache.get(bits)
+        if legal is not None:
+            self._legal_cache.move_to_end(bits)
+            return legal
 
-    def update_predicate(self, state: "up.engines.State", new_preds: set, action: "up.engines.action.Action"):
-        new_preds |= action.add_effects
-        new_preds -= action.del_effects
+        # prone actions that don't add new effects (see `check_action_relevant`)
+        legal = [a for pos, neg, not_relevant_pos, not_relevant_neg, a in self._legal_table
+                 if (bits & pos) == pos and not (bits & neg)
+                 and ((bits & not_relevant_pos) != not_relevant_pos or (bits & not_relevant_neg))]
 
-        add_predicates, del_predicates = self.apply_probabilistic_effects(state, action)
-        new_preds |= add_predicates
-        new_preds -= del_predicates
+        self._legal_cache[bits] = legal
+        if len(self._legal_cache) > LEGAL_ACTIONS_CACHE_SIZE:
+            self._legal_cache.popitem(last=False)
+        return legal
 
-        return new_preds
+    def update_predicate(self, state: "up.engines.State", new_bits: int, action: "up.engines.action.Action"):
+        add_bits, del_bits = self._apply_probabilistic_bits(state, action)
+        return (((new_bits | action.add_mask) & ~action.del_mask) | add_bits) & ~del_bits
 
     def step(self, state: "up.engines.State", action: "up.engines.action.Action"):
         """
                Apply the action to this state to produce the next state.
         """
-        new_preds = set(state.predicates)
-        new_preds = self.update_predicate(state, new_preds, action)
-        next_state = up.engines.State(new_preds)
+        add_bits, del_bits = self._apply_probabilistic_bits(state, action)
+        new_bits = (((state.bits | action.add_mask) & ~action.del_mask) | add_bits) & ~del_bits
 
-        terminal = self.is_terminal(next_state)
+        terminal = (new_bits & self._goal_mask) == self._goal_mask
+        next_state = self._state(new_bits)
         relevant_reward = 0
         # relevant_reward = self.check_action_relevant(state, action)
 
@@ -97,18 +242,9 @@ class MDP:
         if not isinstance(action, up.engines.InstantaneousStartAction):
             return True #-1
 
-        add = action.add_effects.copy()
-        # Remove inExecution - this is not considered new effect
-        for add_effect in add.copy():
-            if add_effect._content.payload == self.problem.fluent_by_name('inExecution'):
-                add.remove(add_effect)
-
-        not_relevant = add.issubset(state.predicates)
-        # not_relevant &= action.del_effects.isdisjoint(state.predicates)
-        not_relevant &= action.end_action.add_effects.issubset(state.predicates)
-        not_relevant &= action.end_action.del_effects.isdisjoint(state.predicates)
-        for pe in action.end_action.probabilistic_effects:
-            not_relevant = not_relevant & set(pe.fluents).issubset(state.predicates)
+        bits = state.bits
+        not_relevant = (bits & action.not_relevant_pos_mask) == action.not_relevant_pos_mask \
+            and not (bits & action.not_relevant_neg_mask)
 
         if not_relevant:
             return False #-50
@@ -129,6 +265,37 @@ class MDP:
 
         return probability, add_predicates, del_predicates
 
+    def probabilistic_outcomes(self, state: "up.engines.State", pe: "up.model.effect.ProbabilisticEffect"):
+        """
+        The outcome distribution of `pe` may depend on the state, so it is memoized per state
+
+        :return: the alias tables of the outcomes distribution of `pe` in `state` (see `_sample_outcome`)
+                 and the predicates each outcome adds and removes, as sets and as bitmasks
+        """
+        key = (id(pe), state.bits)
+        cached = self._outcomes_cache.get(key) if state.bits is not None else None
+        if cached is not None:
+            self._outcomes_cache.move_to_end(key)
+            return cached
+
+        prob_outcomes = pe.probability_function(state, None)
+        outcomes = []
+        for index in range(len(prob_outcomes)):
+            _, add, delete = self.probabilistic_effects(prob_outcomes, index)
+            outcomes.append((add, delete, self.fluents_mask(add), self.fluents_mask(delete)))
+        # The probability mass that is missing to 1 is given to the last outcome
+        cum = np.minimum(np.cumsum(np.fromiter(prob_outcomes.keys(), dtype=np.float64, count=len(prob_outcomes))), 1)
+        probabilities = np.diff(cum, prepend=0.0)
+        if len(probabilities) > 0:
+            probabilities[-1] += 1 - cum[-1]
+
+        cached = (_alias_table(probabilities), tuple(outcomes))
+        if state.bits is not None:
+            self._outcomes_cache[key] = cached
+            if len(self._outcomes_cache) > OUTCOMES_CACHE_SIZE:
+                self._outcomes_cache.popitem(last=False)
+        return cached
+
     def apply_probabilistic_effects(self, state: "up.engines.State", action: "up.engines.Action"):
         """
 
@@ -139,17 +306,60 @@ class MDP:
         del_predicates = set()
 
         for pe in action.probabilistic_effects:
-            prob_outcomes = pe.probability_function(state, None)
-            if prob_outcomes:
-                index = np.random.choice(len(prob_outcomes), p=list(prob_outcomes.keys()))
-
-                _, add, delete = self.probabilistic_effects(prob_outcomes, index)
+            alias, outcomes = self.probabilistic_outcomes(state, pe)
+            if outcomes:
+                index = self._sample_outcome(alias)
+                add, delete, _, _ = outcomes[index]
 
                 add_predicates.update(add)
                 del_predicates.update(delete)
 
         return add_predicates, del_predicates
 
+    def seed(self, seed: int):
+        """ Reseeds the random generator used to draw the probabilistic outcomes """
+        self._rng = np.random.default_rng(seed)
+        self._rng_i = len(self._rng_buf)
+
+    def _uniform(self):
+        """ Returns the next uniform sample in [0, 1), the samples are drawn in batches of `RNG_BUFFER_SIZE` """
+        if self._rng_i >= len(self._rng_buf):
+            self._rng_buf = self._rng.random(RNG_BUFFER_SIZE)
+            self._rng_i = 0
+        u = self._rng_buf[self._rng_i]
+        self._rng_i += 1
+        self._draws += 1
+        return u
+
+    def _sample_outcome(self, alias: Tuple[List[float], List[int]]):
+        """
+        Draws an outcome from its alias tables with a single uniform sample:
+        the integer part picks a column and the fraction decides between the column and its alias
+        """
+        keep, aliases = alias
+        u = self._uniform() * len(keep)
+        column = min(int(u), len(keep) - 1)
+        return column if u - column < keep[column] else aliases[column]
+
+    def _apply_probabilistic_bits(self, state: "up.engines.State", action: "up.engines.Action"):
+        """
+        Same as `apply_probabilistic_effects` on the bits representation
+
+        :return: the bitmasks of the predicates that needs to be added and removed from the state
+        """
+        add_bits = 0
+        del_bits = 0
+
+        for pe in action.probabilistic_effects:
+            alias, outcomes = self.probabilistic_outcomes(state, pe)
+            if outcomes:
+                index = self._sample_outcome(alias)
+                _, _, add, delete = outcomes[index]
+                add_bits |= add
+                del_bits |= delete
+
+        return add_bits, del_bits
+
 
 class combinationMDP(MDP):
     def __init__(self, problem: "up.model.problem.Problem", discount_factor: float):
@@ -160,9 +370,11 @@ class combinationMDP(MDP):
 
         :return: the initial state of the problem
         """
-        predicates = self.problem.initial_values
-        pos_predicates = set([key for key, value in predicates.items() if value.bool_constant_value()])
-        return up.engines.CombinationState(pos_predicates)
+        return self._combination_state(self._initial_bits)
+
+    def _combination_state(self, bits: int, active_actions: "up.engines.ActionQueue" = None, current_time: int = None):
+        return up.engines.CombinationState(active_actions=active_actions, current_time=current_time,
+                                           bits=bits, fluents=self._id_fluent)
 
     def is_terminal(self, state: "up.engines.state.CombinationState"):
         """
@@ -193,7 +405,7 @@ class combinationMDP(MDP):
 
         """
 
-        new_preds = set(state.predicates)
+        new_bits = state.bits
         new_active_actions = state.active_actions.clone()
         current_time = state.current_time
 
@@ -203,14 +415,13 @@ class combinationMDP(MDP):
         # Deals with no-op, durative actions and combination actions
         else:
             if isinstance(action, up.engines.DurativeAction):
-                new_active_actions.add_action(up.engines.QueueNode(action, action.duration.lower.int_constant_value()))
-                new_preds |= action.inExecution
+                new_active_actions.add_action(up.engines.QueueNode(action, action._duration_int))
+                new_bits |= action.inExecution_mask
 
             elif isinstance(action, up.engines.CombinationAction):
-                for a in action.actions:
-                    new_active_actions.add_action(up.engines.QueueNode(a, a.duration.lower.int_constant_value()))
+                new_active_actions.bulk_add([up.engines.QueueNode(a, a._duration_int) for a in action.actions])
 
-                new_preds |= action.inExecution
+                new_bits |= action.inExecution_mask
 
             delta, actions_to_perform = new_active_actions.get_next_actions()
 
@@ -220,9 +431,9 @@ class combinationMDP(MDP):
 
         # update the predicates according to the actions needs to be preformed
         for a in actions_to_perform:
-            new_preds = super().update_predicate(state, new_preds, a)
+            new_bits = super().update_predicate(state, new_bits, a)
 
-        next_state = up.engines.CombinationState(new_preds, new_active_actions, current_time)
+        next_state = self._combination_state(new_bits, new_active_actions, current_time)
 
         terminal = self.is_terminal(next_state)
 
@@ -236,32 +447,29 @@ class combinationMDP(MDP):
 
     def transition_function(self, state: "up.engines.State", action: "up.engines.Action"):
 
-        new_preds_init = set(state.predicates)
+        new_bits_init = state.bits
         new_active_actions = state.active_actions.clone()
         current_time = state.current_time
 
         if isinstance(action, up.engines.InstantaneousAction):
-            new_preds_init |= action.add_effects
-            new_preds_init -= action.del_effects
+            new_bits_init = (new_bits_init | action.add_mask) & ~action.del_mask
             actions_to_perform = [action]
 
         # Deals with no-op, durative actions and combination actions
         else:
             if isinstance(action, up.engines.DurativeAction):
-                new_active_actions.add_action(up.engines.QueueNode(action, action.duration.lower.int_constant_value()))
-                new_preds_init |= action.inExecution
+                new_active_actions.add_action(up.engines.QueueNode(action, action._duration_int))
+                new_bits_init |= action.inExecution_mask
 
             elif isinstance(action, up.engines.CombinationAction):
-                for a in action.actions:
-                    new_active_actions.add_action(up.engines.QueueNode(a, a.duration.lower.int_constant_value()))
+                new_active_actions.bulk_add([up.engines.QueueNode(a, a._duration_int) for a in action.actions])
 
-                new_preds_init |= action.inExecution
+                new_bits_init |= action.inExecution_mask
 
             delta, actions_to_perform = new_active_actions.get_next_actions()
 
             for a in actions_to_perform:
-                new_preds_init |= a.add_effects
-                new_preds_init -= a.del_effects
+                new_bits_init = (new_bits_init | a.add_mask) & ~a.del_mask
 
             if delta != -1:
                 new_active_actions.update_delta(delta)
@@ -270,10 +478,8 @@ class combinationMDP(MDP):
         probs = self.all_probabilistic_effects(state, actions_to_perform)
         transition = []
         for prob in probs:
-            new_preds = new_preds_init.copy()
-            new_preds |= prob['add']
-            new_preds -= prob['delete']
-            next_state = up.engines.CombinationState(new_preds, new_active_actions, current_time)
+            new_bits = (new_bits_init | self.fluents_mask(prob['add'])) & ~self.fluents_mask(prob['delete'])
+            next_state = self._combination_state(new_bits, new_active_actions, current_time)
             transition.append((next_state, prob['probability']))
 
         return transition
@@ -318,6 +524,6 @@ class combinationMDP(MDP):
         :return: the legal actions that can be preformed in the state `state`
         """
         legal_actions = super().legal_actions(state)
-        if state.active_actions.data:
-            legal_actions.append(self.problem.action_by_name('noop'))
+        if len(state.active_actions) > 0:
+            legal_actions = legal_actions + [self.problem.action_by_name('noop')]
         return legal_actions
\ No newline at end of file
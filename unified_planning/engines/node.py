@@ -1,5 +1,6 @@
 import math
 
+import numpy as np
 import unified_planning as up
 from typing import List, Dict
 from unified_planning.shortcuts import *
@@ -9,7 +10,63 @@ from unified_planning.engines.utils import (
 from unified_planning.engines.linked_list import LinkedList
 
 
+def _init_child_statistics(snode):
+    """ Allocates the children arrays of `snode`, the children are ordered like the possible actions """
+    n = len(snode._child_anodes)
+    snode._child_counts = np.zeros(n, dtype=np.float64)
+    snode._child_values = np.zeros(n, dtype=np.float64)
+    snode._child_means = np.zeros(n, dtype=np.float64)
+    snode._child_inv_sqrt_counts = np.zeros(n, dtype=np.float64)
+
+
+def _set_child_statistics(snode, index: int, count: float, value: float):
+    """ Writes the statistics of the child `index` of `snode` into the children arrays of `snode` """
+    snode._child_counts[index] = count
+    snode._child_values[index] = value
+    snode._child_means[index] = value / count
+    snode._child_inv_sqrt_counts[index] = 1.0 / math.sqrt(count)
+
+
+
+def _uct(snode, explore_constant: float):
+    """
+    :return: the first action of `snode` that was not visited yet,
+             otherwise the action with the highest upper confidence bound
+    """
+    if len(snode.possible_actions) == 1:
+        # a forced move
+        return snode.possible_actions[0]
+
+    counts = snode._child_counts
+    not_visited = np.flatnonzero(counts == 0)
+    if len(not_visited) > 0:
+        return snode.possible_actions[not_visited[0]]
+
+    # value / count + c * sqrt(log(N) / count), with the per child terms kept up to date by the children
+    ub = snode._child_means + (explore_constant * math.sqrt(math.log(snode.count))) * snode._child_inv_sqrt_counts
+    return snode.possible_actions[int(np.argmax(ub))]
+
+
+def _best_action(actions, counts: np.ndarray, values: np.ndarray):
+    """
+    :return: the first action with the highest value among the visited actions, -1 if none of them has a value
+    """
+    values = np.where(counts > 0, values, -math.inf)
+    best = int(np.argmax(values)) if len(values) > 0 else -1
+    if best == -1 or values[best] == -math.inf:
+        return -1
+    return actions[best]
+
+
+def _max_child_value(snode):
+    """ :return: the highest value among the visited children of `snode`, -inf if none was visited """
+    visited = snode._child_counts > 0
+    return float(snode._child_values[visited].max()) if visited.any() else -math.inf
+
+
 class Node:
+    __slots__ = ('_count', '_value', '_linkList', '_isInterval')
+
     def __init__(self, isInterval=False):
         if isInterval:
             # The node value is per intervals, each interval is a node in the link list
@@ -56,6 +113,8 @@ class Node:
 
 class SNode(Node):
     """ State node """
+    __slots__ = ('_state', '_depth', '_parent', '_children', '_possible_actions',
+                 '_child_anodes', '_child_counts', '_child_values', '_child_means', '_child_inv_sqrt_counts')
 
     def __init__(self, state: "up.engines.State", depth: int, possible_actions: List["up.engines.Action"],
                  parent: "up.engines.ANode" = None):
@@ -63,7 +122,8 @@ class SNode(Node):
         self._state = state
         self._depth = depth
         self._parent = parent
-        self._possible_actions = possible_actions
+        # A tuple, the legal actions list of the MDP is shared between the states and must not be changed
+        self._possible_actions = tuple(possible_actions)
         self._children: Dict["up.engines.Action", "up.engines.ANode"] = {}
         self._add_children()
 
@@ -81,12 +141,22 @@ class SNode(Node):
         return self._depth
 
     def set_depth(self, depth):
-        self._depth = depth
+        """ Sets the depth of the node, the depths of all its descendants are shifted along """
+        shift = depth - self._depth
+        snodes = [self]
+        while snodes:
+            snode = snodes.pop()
+            snode._depth += shift
+            for anode in snode.children.values():
+                snodes.extend(anode.children.values())
 
     @property
     def parent(self):
         return self._parent
 
+    def set_parent(self, parent: "up.engines.ANode"):
+        self._parent = parent
+
     @property
     def possible_actions(self):
         return self._possible_actions
@@ -98,17 +168,31 @@ class SNode(Node):
     def _add_children(self):
         """
         Adds to the SNode the possible actions as children.
+        The visits and values of the children are mirrored in arrays, by the order of the possible actions,
+        so they can be scanned without visiting each ANode.
 
         :param previous_chosen_action_node: the action chosen in the last search step
         """
-        for action in self.possible_actions:
-            self.children[action] = ANode(action, self)
+        self._child_anodes = [ANode(action, self, i) for i, action in enumerate(self.possible_actions)]
+        _init_child_statistics(self)
+        for anode in self._child_anodes:
+            self.children[anode.action] = anode
+
+    def uct(self, explore_constant: float):
+        """
+        :return: the first action that was not visited yet,
+                 otherwise the action with the highest upper confidence bound
+        """
+        return _uct(self, explore_constant)
+
+    def best_action(self):
+        """
+        :return: the first action with the highest value among the visited actions, -1 if none of them has a value
+        """
+        return _best_action(self.possible_actions, self._child_counts, self._child_values)
 
     def max_update(self):
-        max_v = -math.inf
-        for child in self.children.values():
-           if child.count > 0 and child.value > max_v:
-                max_v = child.value
+        max_v = _max_child_value(self)
         self._value = max_v
         self._count += 1
         return max_v
@@ -116,6 +200,8 @@ class SNode(Node):
 
 class C_SNode(Node):
     """ State node with consistency STN check """
+    __slots__ = ('_state', '_depth', '_parent', '_children', '_possible_actions',
+                 '_child_anodes', '_child_counts', '_child_values', '_child_means', '_child_inv_sqrt_counts')
 
     def __init__(self, state: "up.engines.State", depth: int, possible_actions: List["up.engines.Action"],
                  stn: "up.plans.stn.STNPlan", parent: "up.engines.ANode" = None,
@@ -125,7 +211,7 @@ class C_SNode(Node):
         self._depth = depth
         self._parent = parent
         self._children: Dict["up.engines.Action", "up.engines.C_ANode"] = {}
-        self._possible_actions = possible_actions
+        self._possible_actions = tuple(possible_actions)
         self._add_children(stn, previous_chosen_action_node)
 
     def __repr__(self):
@@ -158,7 +244,14 @@ class C_SNode(Node):
 
     def remove_action(self, action: "up.engines.Action"):
         if action in self._possible_actions:
-            self._possible_actions.remove(action)
+            i = self._possible_actions.index(action)
+            self._possible_actions = self._possible_actions[:i] + self._possible_actions[i + 1:]
+            # the children arrays follow the order of the possible actions
+            del self._child_anodes[i]
+            for anode in self._child_anodes[i:]:
+                anode._index -= 1
+            for name in ('_child_counts', '_child_values', '_child_means', '_child_inv_sqrt_counts'):
+                setattr(self, name, np.delete(getattr(self, name), i))
 
     def _add_children(self, stn: "up.plans.stn.STNPlan",
                       previous_chosen_action_node: "up.plans.stn.STNPlanNode" = None):
@@ -171,17 +264,33 @@ class C_SNode(Node):
         :param previous_chosen_action_node: the action chosen in the last search step
         :return:
         """
-        not_consistent = []
+        consistent = []
+        self._child_anodes = []
         for action in self.possible_actions:
             child = C_ANode(action, stn.clone(), self, previous_chosen_action_node, isInterval=self.isInterval)
 
             if child.is_consistent():
+                child._index = len(self._child_anodes)
                 self.children[action] = child
-            else:
-                not_consistent.append(action)
+                self._child_anodes.append(child)
+                consistent.append(action)
+
+        self._possible_actions = tuple(consistent)
+        # The visits and values of the children, by the order of the possible actions
+        _init_child_statistics(self)
 
-        for a in not_consistent:
-            self.possible_actions.remove(a)
+    def uct(self, explore_constant: float):
+        """
+        :return: the first action that was not visited yet,
+                 otherwise the action with the highest upper confidence bound
+        """
+        return _uct(self, explore_constant)
+
+    def best_action(self):
+        """
+        :return: the first action with the highest value among the visited actions, -1 if none of them has a value
+        """
+        return _best_action(self.possible_actions, self._child_counts, self._child_values)
 
     def max_update(self, node=None):
         self._count += 1
@@ -191,10 +300,7 @@ class C_SNode(Node):
             return self.max_update_interval(node)
 
     def max_update_wo_interval(self):
-        max_v = -math.inf
-        for child in self.children.values():
-           if child.count > 0 and child.value > max_v:
-                max_v = child.value
+        max_v = _max_child_value(self)
         self._value = max_v
         return max_v
 
@@ -205,13 +311,18 @@ class C_SNode(Node):
 
 class ANode(Node):
     """ Action node """
+    __slots__ = ('_action', '_parent', '_children', '_index', '_step_result')
 
     def __init__(self, action: "up.engines.action.Action",
-                 parent: "up.engines.node.SNode" = None):
+                 parent: "up.engines.node.SNode" = None, index: int = None):
         super().__init__()
         self._action = action
         self._parent = parent
         self._children: Dict["up.engines.State", "up.engines.node.SNode"] = {}
+        # The position of this node in the children arrays of the parent
+        self._index = index
+        # The result of `mdp.step` for the action, kept when the step is deterministic
+        self._step_result = None
 
     def __repr__(self):
         s = "action Node; children: %d; visits: %d; reward: %f" % (len(self.children), self.count, self.value)
@@ -232,12 +343,25 @@ class ANode(Node):
     def add_child(self, child_node: "up.engines.SNode"):
         self._children[child_node.state] = child_node
 
+    @property
+    def step_result(self):
+        return self._step_result
+
+    def set_step_result(self, step_result):
+        self._step_result = step_result
+
     def isLeaf(self):
         return self.children
 
+    def update(self, reward, lower = None, upper = None):
+        super().update(reward, lower, upper)
+        if self._index is not None:
+            _set_child_statistics(self._parent, self._index, self._count, self._value)
+
 
 class C_ANode(Node):
     """ Action node with consistency STN check """
+    __slots__ = ('_action', '_parent', '_children', '_stn', '_STNNode', '_index', '_step_result')
 
     def __init__(self, action: "up.engines.action.Action", stn: "up.plans.stn.STNPlan",
                  parent: "up.engines.node.C_SNode" = None,
@@ -248,6 +372,10 @@ class C_ANode(Node):
         self._children: Dict["up.engines.State", "up.engines.node.SNode"] = {}
         self._stn = stn
         self._STNNode = self._add_constraints(previous_chosen_action_node)
+        # The position of this node in the children arrays of the parent, set when the node is consistent
+        self._index = None
+        # The result of `mdp.step` for the action, kept when the step is deterministic
+        self._step_result = None
 
     def __repr__(self):
         s = "action Node; children: %d; visits: %d; reward: %f" % (len(self.children), self.count, self.value)
@@ -272,9 +400,21 @@ class C_ANode(Node):
     def add_child(self, child_node: "up.engines.SNode"):
         self._children[child_node.state] = child_node
 
+    @property
+    def step_result(self):
+        return self._step_result
+
+    def set_step_result(self, step_result):
+        self._step_result = step_result
+
     def isLeaf(self):
         return self.children
 
+    def update(self, reward, lower = None, upper = None):
+        super().update(reward, lower, upper)
+        if self._index is not None:
+            _set_child_statistics(self._parent, self._index, self._count, self.value)
+
     @property
     def stn(self):
         return self._stn
@@ -4,21 +4,33 @@ import unified_planning as up
 import math
 import time
 import random
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from unified_planning.engines.utils import (
     create_init_stn,
     update_stn,
 )
 from unified_planning.engines.linked_list import LinkedListNode
+from unified_planning.engines.node import _best_action
+
+# The maximal amount of heuristic values kept in memory by an MCTS instance
+HEURISTIC_CACHE_SIZE = 100000
 
 
 class Base_MCTS:
     def __init__(self, mdp: "up.engines.MDP", search_depth: int,
-                 exploration_constant: float, k: int):
+                 exploration_constant: float, k: int, seed: int = None):
         self._mdp = mdp
         self._search_depth = search_depth
         self._exploration_constant = exploration_constant
         self._root_node = None
         self._k = k
+        self._h_cache: "OrderedDict[tuple, float]" = OrderedDict()
+        # The random generator of the search, the global `random` state is not touched
+        self._rng = random.Random(seed)
+        # The TRPG compiled for the MDP the heuristic is computed with, set by the subclasses
+        self._trpg: "up.engines.heuristics.TRPG_Compiled" = None
 
     @property
     def mdp(self):
@@ -46,29 +58,19 @@ class Base_MCTS:
     def set_root_node(self, root_node):
         self._root_node = root_node
 
-    def default_policy(self, state: "up.engines.State"):
-        """ Choose a random action. Heustics can be used here to improve simulations. """
-        return random.choice(self.mdp.legal_actions(state))
+    def default_policy(self, state: "up.engines.State", legal_actions=None):
+        """
+        Choose a random action. Heustics can be used here to improve simulations.
+
+        :param legal_actions: the legal actions of `state`, when they are already known
+        """
+        if legal_actions is None:
+            legal_actions = self.mdp.legal_actions(state)
+        return self._rng.choice(legal_actions)
 
     def uct(self, snode: "up.engines.Snode", explore_constant: float):
-        anodes = snode.children
-        best_ub = -float('inf')
-        best_action = -1
-        possible_actions = snode.possible_actions
-        for action in possible_actions:
-            if anodes[action].count == 0:
-                return action
-
-            ub = (anodes[action].value / anodes[action].count) + (
-                    explore_constant * math.sqrt(math.log(snode.count) / anodes[action].count))
-            # ub = anodes[action].value + (
-            #         explore_constant * math.sqrt(math.log(snode.count + 1) / anodes[action].count))
-            if ub > best_ub:
-                best_ub = ub
-                best_action = action
-
-        assert best_action != -1
-        return best_action
+        """ The UCB scores of all the children are computed at once on the arrays of `snode` """
+        return snode.uct(explore_constant)
 
     def best_action(self, root_node: "up.engines.SNode"):
         """
@@ -76,34 +78,91 @@ class Base_MCTS:
         :param root_node: the root node of the MCTS tree
         :return: returns the best action for the `root_node`
         """
-        anodes = root_node.children
-        aStart_value = float("-inf")
-        aStar = -1
-
-        for action in root_node.possible_actions:
-            if anodes[action].count > 0 and anodes[action].value > aStart_value:
-                aStart_value = anodes[action].value
-                aStar = action
+        aStar = root_node.best_action()
 
         if aStar == -1:
             print(4)
 
         return aStar
 
-    def search(self, timeout=1, selection_type='avg'):
+    def search(self, timeout=1, selection_type='avg', workers=1):
         """
         Execute the MCTS algorithm from the initial state given, with timeout in seconds
+
+        :param workers: the amount of processes searching in parallel from the root (root parallelization),
+                        the root interval values can't be merged so the rootInterval selection always runs in one process
         """
-        start_time = time.time()
-        current_time = time.time()
+        if workers > 1 and selection_type != 'rootInterval' and 'fork' in multiprocessing.get_all_start_methods():
+            return self.parallel_search(timeout, selection_type, workers)
+
+        self._search_loop(timeout, selection_type)
+        return self.best_action(self.root_node)
+
+    def _search_loop(self, timeout, selection_type):
+        """ Runs selections until `timeout` seconds pass """
+        end_time = time.monotonic() + timeout
         i = 0
         selection = self.selection if selection_type == 'avg' else (self.selection_root_interval if selection_type == 'rootInterval' else self.selection_max)
-        while current_time < start_time + timeout:
+        # A selection evaluates the TRPG heuristic, reading the clock after each one is negligible
+        while time.monotonic() < end_time:
             selection(self.root_node)
-            current_time = time.time()
             i += 1
         # print(f'i = {i}')
-        return self.best_action(self.root_node)
+
+    def seed(self, seed: int):
+        self._rng.seed(seed)
+        self.mdp.seed(seed)
+
+    def parallel_search(self, timeout, selection_type, workers):
+        """
+        Root parallelization - each worker grows its own copy of the tree, with a different seed, for `timeout` seconds.
+        The statistics of the root actions are merged and the action with the best average value is returned.
+
+        The workers are forked so they inherit the tree and the MDP, which hold objects that can't be pickled.
+        Only the root statistics are sent back, the trees the workers grow are lost and this tree is not changed.
+        """
+        global _parallel_mcts
+        _parallel_mcts = self
+        seeds = [self._rng.getrandbits(32) for _ in range(workers)]
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                results = list(executor.map(_search_worker, seeds, [timeout] * workers, [selection_type] * workers))
+        finally:
+            _parallel_mcts = None
+
+        counts, values = _merge_root_statistics(self.root_node, results)
+        return _best_action(self.root_node.possible_actions, counts, values)
+
+    def step(self, snode, action: "up.engines.Action"):
+        """
+        Performs `action` in the state of `snode`.
+        When the step draws no random sample its result is kept on the action node and reused on the next visits.
+        """
+        anode = snode.children[action]
+        if anode.step_result is not None:
+            return anode.step_result
+
+        draws = self.mdp.draws
+        result = self.mdp.step(snode.state, action)
+        if self.mdp.draws == draws:
+            anode.set_step_result(result)
+        return result
+
+    def trpg_heuristic(self, key, state: "up.engines.State", current_time: int, lower_bounds=None):
+        """
+        The TRPG heuristic of `state`, memoized by `key`.
+        `key` must identify the state, the current time and the lower bounds the heuristic is computed with.
+        """
+        value = self._h_cache.get(key)
+        if value is not None:
+            self._h_cache.move_to_end(key)
+            return value
+
+        value = self._trpg.evaluate(state, current_time, lower_bounds)
+        self._h_cache[key] = value
+        if len(self._h_cache) > HEURISTIC_CACHE_SIZE:
+            self._h_cache.popitem(last=False)
+        return value
 
     def selection(self, snode: "up.engines.Snode"):
         raise NotImplementedError
@@ -117,21 +176,66 @@ class Base_MCTS:
         raise NotImplementedError
 
     def simulate(self, state, depth):
+        """
+        A random rollout from `state`, an alternative evaluation of a new leaf.
+        The selections evaluate the leaves with the heuristic and don't call it.
+        """
         raise NotImplementedError
 
 
+# The searched MCTS, inherited by the forked workers of `Base_MCTS.parallel_search`
+_parallel_mcts = None
+
+
+def _merge_root_statistics(root_node: "up.engines.SNode", results):
+    """
+    Merges the statistics of the root actions sent back by the workers of `Base_MCTS.parallel_search`
+
+    :return: the visits and the average value of each action of `root_node`, by the order of its possible actions
+    """
+    index = {action.name: i for i, action in enumerate(root_node.possible_actions)}
+    counts = np.zeros(len(index), dtype=np.float64)
+    values = np.zeros(len(index), dtype=np.float64)
+    for result in results:
+        for name, (value, count) in result.items():
+            counts[index[name]] += count
+            values[index[name]] += value * count
+
+    visited = counts > 0
+    values[visited] /= counts[visited]
+    return counts, values
+
+
+def _search_worker(seed: int, timeout, selection_type):
+    """
+    Searches the tree of `_parallel_mcts` in a forked worker
+
+    :return: the value and the amount of visits of each visited root action, by the action name
+    """
+    _parallel_mcts.seed(seed)
+    _parallel_mcts._search_loop(timeout, selection_type)
+    return {anode.action.name: (anode.value, anode.count)
+            for anode in _parallel_mcts.root_node.children.values() if anode.count > 0}
+
+
 class MCTS(Base_MCTS):
     """
     Original MCTS solver implementation.
     """
     def __init__(self, mdp: "up.engines.MDP", split_mdp: "up.engines.MDP", root_node: "up.engines.SNode",
                  root_state: "up.engines.state.State", search_depth: int,
-                 exploration_constant: float, selection_type, k: int):
-        super().__init__(mdp, search_depth, exploration_constant, k)
+                 exploration_constant: float, selection_type, k: int, seed: int = None):
+        super().__init__(mdp, search_depth, exploration_constant, k, seed)
         self.split_mdp = split_mdp
-        create_snode = self.create_Snode_max if selection_type == 'max' else self.create_Snode
-        snode, _ = create_snode(root_state, 0)
-        self.set_root_node(root_node if root_node is not None else snode)
+        self._trpg = up.engines.heuristics.TRPG_Compiled(split_mdp)
+        if root_node is None:
+            create_snode = self.create_Snode_max if selection_type == 'max' else self.create_Snode
+            root_node, _ = create_snode(root_state, 0)
+        self.set_root_node(root_node)
+
+    def seed(self, seed: int):
+        super().seed(seed)
+        self.split_mdp.seed(seed + 1)
 
     def create_Snode(self, state: "up.engines.State", depth: int,
                      parent: "up.engines.ANode" = None):
@@ -151,12 +255,12 @@ class MCTS(Base_MCTS):
         actions_idx = list(range(len(snode.children)))
         if self.k < len(snode.children):
             # samples k children
-            actions_idx = random.sample(range(0, len(snode.children)), self.k)
+            actions_idx = self._rng.sample(range(0, len(snode.children)), self.k)
 
         for action_idx in actions_idx:
             # perform each action and evaluate the next state with the heuristic function
-            action = list(snode.children.keys())[action_idx]
-            terminal, next_state, reward = self.mdp.step(snode.state, action)
+            action = snode.possible_actions[action_idx]
+            terminal, next_state, reward = self.step(snode, action)
             reward += self.mdp.discount_factor * self.heuristic(next_state)
             snode.children[action].update(reward)
             if reward > best:
@@ -171,40 +275,55 @@ class MCTS(Base_MCTS):
         current_time = 0
         if isinstance(state, up.engines.CombinationState):
             current_time = state.current_time
-        h = up.engines.heuristics.TRPG(self.split_mdp, state, current_time)
-        return h.get_heuristic()
+        return self.trpg_heuristic((state.bits, current_time), state, current_time)
 
     def selection(self, snode: "up.engines.Snode"):
         """
         Traverse the tree until reaching a leaf node.
+        The tree is descended in a loop, the visited nodes are kept in `path` and updated bottom up afterwards.
         """
-        if len(snode.possible_actions) == 0 or snode.state.current_time > self.mdp.deadline():
-            # Stop when there are no possible actions to take so the plan remains consistent
-            return -100
+        path = []
+        value = None
+        explore_constant = self.exploration_constant
+        deadline = self.mdp.deadline()
 
-        if snode.depth > self.search_depth:
-            return self.heuristic(snode.state)
+        while True:
+            if len(snode.possible_actions) == 0 or snode.state.current_time > deadline:
+                # Stop when there are no possible actions to take so the plan remains consistent
+                value = -100
+                break
 
-        explore_constant = self.exploration_constant
+            if snode.depth > self.search_depth:
+                value = self.heuristic(snode.state)
+                break
 
-        # Choose a consistent action
-        action = self.uct(snode, explore_constant)
-        terminal, next_state, reward = self.mdp.step(snode.state, action)
-        anode = snode.children[action]
-        if not terminal:
-            snodes = anode.children
-            if next_state in snodes:
-                reward += self.mdp.discount_factor * self.selection(snodes[next_state])
+            # Choose a consistent action
+            action = self.uct(snode, explore_constant)
+            terminal, next_state, reward = self.step(snode, action)
+            anode = snode.children[action]
+            if terminal:
+                path.append((snode, anode, reward))
+                break
 
-            else: # leaf
+            snodes = anode.children
+            if next_state not in snodes: # leaf
                 next_snode, _ = self.create_Snode(next_state, snode.depth + 1, anode)
                 reward += self.mdp.discount_factor * self.heuristic(next_state)
                 anode.add_child(next_snode)
+                path.append((snode, anode, reward))
+                break
+
+            path.append((snode, anode, reward))
+            snode = snodes[next_state]
 
-        snode.update(reward)
-        anode.update(reward)
+        for snode, anode, reward in reversed(path):
+            if value is not None:
+                reward += self.mdp.discount_factor * value
+            snode.update(reward)
+            anode.update(reward)
+            value = reward
 
-        return reward
+        return value
 
     def selection_max(self, snode: "up.engines.Snode"):
         """
@@ -212,48 +331,75 @@ class MCTS(Base_MCTS):
         Selection with max logic -
         average between states and maximum between possible actions
         """
-        if len(snode.possible_actions) == 0 or snode.state.current_time > self.mdp.deadline():
-            # Stop when there are no possible actions to take so the plan remains consistent
-            return -100
-
-        if snode.depth > self.search_depth:
-            # Stop if the search depth is reached
-            return self.heuristic(snode.state)
+        path = []
+        value = None
         explore_constant = self.exploration_constant
+        deadline = self.mdp.deadline()
 
-        # Choose a consistent action
-        action = self.uct(snode, explore_constant)
-        terminal, next_state, reward = self.mdp.step(snode.state, action)
-        anode = snode.children[action]
-        if not terminal:
-            snodes = anode.children
-            if next_state in snodes:
-                reward += self.mdp.discount_factor * self.selection_max(snodes[next_state])
+        while True:
+            if len(snode.possible_actions) == 0 or snode.state.current_time > deadline:
+                # Stop when there are no possible actions to take so the plan remains consistent
+                value = -100
+                break
+
+            if snode.depth > self.search_depth:
+                # Stop if the search depth is reached
+                value = self.heuristic(snode.state)
+                break
+
+            # Choose a consistent action
+            action = self.uct(snode, explore_constant)
+            terminal, next_state, reward = self.step(snode, action)
+            anode = snode.children[action]
+            if terminal:
+                path.append((snode, anode, reward))
+                break
 
-            else: # leaf
+            snodes = anode.children
+            if next_state not in snodes: # leaf
                 next_snode, snode_reward = self.create_Snode_max(next_state, snode.depth + 1, anode)
                 reward += snode_reward
                 anode.add_child(next_snode)
+                path.append((snode, anode, reward))
+                break
+
+            path.append((snode, anode, reward))
+            snode = snodes[next_state]
 
-        anode.update(reward)
-        max_v = snode.max_update()
+        for snode, anode, reward in reversed(path):
+            if value is not None:
+                reward += self.mdp.discount_factor * value
+            anode.update(reward)
+            value = snode.max_update()
 
-        return max_v
+        return value
 
     def simulate(self, state, depth):
         """ Simulate until a terminal state """
         cumulative_reward = 0.0
         terminal = False
         deadline = self.mdp.deadline()
-        while not terminal and depth < self.search_depth and len(self.mdp.legal_actions(state)) > 0:
+        gamma = self.mdp.discount_factor
+        discount = gamma ** depth
+        # The rollout is the hottest loop of the search, the attribute lookups are bound once
+        search_depth = self.search_depth
+        legal_actions = self.mdp.legal_actions
+        mdp_step = self.mdp.step
+        default_policy = self.default_policy
+        while not terminal and depth < search_depth:
+            actions = legal_actions(state)
+            if len(actions) == 0:
+                break
+
             # Choose an action to execute
-            action = self.default_policy(state)
+            action = default_policy(state, actions)
 
             # Execute the action
-            (terminal, next_state, reward) = self.mdp.step(state, action)
+            (terminal, next_state, reward) = mdp_step(state, action)
 
             # Discount the reward
-            cumulative_reward += pow(self.mdp.discount_factor, depth) * reward
+            cumulative_reward += discount * reward
+            discount *= gamma
             depth += 1
 
             state = next_state
@@ -268,14 +414,16 @@ class C_MCTS(Base_MCTS):
     """
     def __init__(self, mdp, root_node: "up.engines.C_SNode", root_state: "up.engines.state.State", search_depth: int,
                  exploration_constant: float, stn: "up.plans.stn.STNPlan", selection_type, k: int,
-                 previous_chosen_action_node: "up.plans.stn.STNPlanNode" = None):
-        super().__init__(mdp, search_depth, exploration_constant, k)
+                 previous_chosen_action_node: "up.plans.stn.STNPlanNode" = None, seed: int = None):
+        super().__init__(mdp, search_depth, exploration_constant, k, seed)
         self._previous_chosen_action_node = previous_chosen_action_node
+        self._trpg = up.engines.heuristics.TRPG_Compiled(mdp)
 
-        create_snode = self.create_Snode_max if selection_type == 'max' else (self.create_Snode_root_interval if selection_type == 'rootInterval' else self.create_Snode)
-        snode, _ = create_snode(root_state, 0, stn,
-                                previous_chosen_action_node=previous_chosen_action_node)
-        self.set_root_node(root_node if root_node is not None else snode)
+        if root_node is None:
+            create_snode = self.create_Snode_max if selection_type == 'max' else (self.create_Snode_root_interval if selection_type == 'rootInterval' else self.create_Snode)
+            root_node, _ = create_snode(root_state, 0, stn,
+                                        previous_chosen_action_node=previous_chosen_action_node)
+        self.set_root_node(root_node)
         self._stn = stn
 
     @property
@@ -312,11 +460,11 @@ class C_MCTS(Base_MCTS):
 
         actions_idx = list(range(len(snode.children)))
         if self.k < len(snode.children):
-            actions_idx = random.sample(range(0, len(snode.children)), self.k)
+            actions_idx = self._rng.sample(range(0, len(snode.children)), self.k)
 
         for action_idx in actions_idx:
-            action = list(snode.children.keys())[action_idx]
-            terminal, next_state, reward = self.mdp.step(snode.state, action)
+            action = snode.possible_actions[action_idx]
+            terminal, next_state, reward = self.step(snode, action)
             reward += self.mdp.discount_factor * self.heuristic_init(next_state, snode.children[action].stn)
             snode.children[action].update(reward)
             if reward > best:
@@ -331,37 +479,51 @@ class C_MCTS(Base_MCTS):
     def selection(self, snode: "up.engines.C_Snode"):
         """
                 Traverse the tree until reaching a leaf node.
+                The tree is descended in a loop, the visited nodes are kept in `path` and updated bottom up afterwards.
          """
-        if len(snode.possible_actions) == 0:
-            # Stop when there are no possible actions to take so the plan remains consistent
-            return -100
-
-        if snode.depth > self.search_depth:
-            # Stop if the search depth is reached
-            # return 0
-            return self.heuristic(snode)
-
+        path = []
+        value = None
         explore_constant = self.exploration_constant
 
-        # Choose a consistent action
-        action = self.uct(snode, explore_constant)
-        terminal, next_state, reward = self.mdp.step(snode.state, action)
-        anode = snode.children[action]
-        if not terminal:
-            snodes = anode.children
-            if next_state in snodes:
-                reward += self.mdp.discount_factor * self.selection(snodes[next_state])
+        while True:
+            if len(snode.possible_actions) == 0:
+                # Stop when there are no possible actions to take so the plan remains consistent
+                value = -100
+                break
+
+            if snode.depth > self.search_depth:
+                # Stop if the search depth is reached
+                value = self.heuristic(snode)
+                break
+
+            # Choose a consistent action
+            action = self.uct(snode, explore_constant)
+            terminal, next_state, reward = self.step(snode, action)
+            anode = snode.children[action]
+            if terminal:
+                path.append((snode, anode, reward))
+                break
 
-            else: # leaf
+            snodes = anode.children
+            if next_state not in snodes: # leaf
                 next_snode, _ = self.create_Snode(next_state, snode.depth + 1, anode.stn, anode)
                 reward += self.mdp.discount_factor * self.heuristic(next_snode)
                 anode.add_child(next_snode)
                 next_snode.update(reward)
+                path.append((snode, anode, reward))
+                break
+
+            path.append((snode, anode, reward))
+            snode = snodes[next_state]
 
-        snode.update(reward)
-        anode.update(reward)
+        for snode, anode, reward in reversed(path):
+            if value is not None:
+                reward += self.mdp.discount_factor * value
+            snode.update(reward)
+            anode.update(reward)
+            value = reward
 
-        return reward
+        return value
 
     def selection_max(self, snode: "up.engines.C_Snode"):
         """
@@ -369,33 +531,47 @@ class C_MCTS(Base_MCTS):
         Selection with max logic -
         average between states and maximum between possible actions
         """
-        if len(snode.possible_actions) == 0:
-            # Stop when there are no possible actions to take so the plan remains consistent
-            return -100
-
-        if snode.depth > self.search_depth:
-            # Stop if the search depth is reached
-            return self.heuristic(snode)
+        path = []
+        value = None
         explore_constant = self.exploration_constant
 
-        # Choose a consistent action
-        action = self.uct(snode, explore_constant)
-        terminal, next_state, reward = self.mdp.step(snode.state, action)
-        anode = snode.children[action]
-        if not terminal:
-            snodes = anode.children
-            if next_state in snodes:
-                reward += self.mdp.discount_factor * self.selection_max(snodes[next_state])
+        while True:
+            if len(snode.possible_actions) == 0:
+                # Stop when there are no possible actions to take so the plan remains consistent
+                value = -100
+                break
+
+            if snode.depth > self.search_depth:
+                # Stop if the search depth is reached
+                value = self.heuristic(snode)
+                break
+
+            # Choose a consistent action
+            action = self.uct(snode, explore_constant)
+            terminal, next_state, reward = self.step(snode, action)
+            anode = snode.children[action]
+            if terminal:
+                path.append((snode, anode, reward))
+                break
 
-            else: #leaf
+            snodes = anode.children
+            if next_state not in snodes: # leaf
                 next_snode, snode_reward = self.create_Snode_max(next_state, snode.depth + 1, anode.stn, anode)
                 reward += snode_reward
                 anode.add_child(next_snode)
+                path.append((snode, anode, reward))
+                break
 
-        anode.update(reward)
-        max_v = snode.max_update()
+            path.append((snode, anode, reward))
+            snode = snodes[next_state]
 
-        return max_v
+        for snode, anode, reward in reversed(path):
+            if value is not None:
+                reward += self.mdp.discount_factor * value
+            anode.update(reward)
+            value = snode.max_update()
+
+        return value
 
     def selection_root_interval(self, snode: "up.engines.C_Snode", root_STNnode: "up.plans.stn.STNPlanNode" = None):
         """
@@ -417,7 +593,7 @@ class C_MCTS(Base_MCTS):
         explore_constant = self.exploration_constant
         # Choose a consistent action
         action = self.uct(snode, explore_constant)
-        terminal, next_state, reward = self.mdp.step(snode.state, action)
+        terminal, next_state, reward = self.step(snode, action)
 
         anode = snode.children[action]
         if root_STNnode is None:
@@ -459,7 +635,7 @@ class C_MCTS(Base_MCTS):
         explore_constant = self.exploration_constant
         # Choose a consistent action
         action = self.uct(snode, explore_constant)
-        terminal, next_state, reward = self.mdp.step(snode.state, action)
+        terminal, next_state, reward = self.step(snode, action)
         anode = snode.children[action]
         if root_STNnode is None:
             root_STNnode = anode.STNNode
@@ -488,17 +664,17 @@ class C_MCTS(Base_MCTS):
         if snode.parent:
             current_time = snode.parent.stn.get_current_end_time()
             lower_bounds = snode.parent.stn.get_lower_bound_potential_end_action()
-        h = up.engines.heuristics.TRPG(self.mdp, snode.state, current_time)
-        return h.get_heuristic(lower_bounds)
+        key = (snode.state.bits, current_time,
+               frozenset((a.name, bound) for a, bound in lower_bounds.items()) if lower_bounds is not None else None)
+        return self.trpg_heuristic(key, snode.state, current_time, lower_bounds)
 
     def heuristic_init(self, state, stn):
         current_time = stn.get_current_end_time()
-        h = up.engines.heuristics.TRPG(self.mdp, state, current_time)
-        return h.get_heuristic()
+        return self.trpg_heuristic((state.bits, current_time, None), state, current_time)
 
 
 def plan(mdp: "up.engines.MDP", steps: int, search_time: int, search_depth: int, exploration_constant: float,
-         selection_type='avg', k=10):
+         selection_type='avg', k=10, workers=1):
     stn = create_init_stn(mdp)
     root_state = mdp.initial_state()
 
@@ -512,7 +688,7 @@ def plan(mdp: "up.engines.MDP", steps: int, search_time: int, search_depth: int,
         print(f"started step {step}")
         mcts = C_MCTS(mdp, root_node, root_state, search_depth, exploration_constant, stn, selection_type, k,
                       previous_action_node)
-        action = mcts.search(search_time, selection_type)
+        action = mcts.search(search_time, selection_type, workers)
 
         if action == -1:
             print("A valid plan is not found")
@@ -550,7 +726,7 @@ def plan(mdp: "up.engines.MDP", steps: int, search_time: int, search_depth: int,
 
 def combination_plan(mdp: "up.engines.MDP", split_mdp: "up.engines.MDP", steps: int, search_time: int,
                      search_depth: int, exploration_constant: float,
-                     selection_type='avg', k=10):
+                     selection_type='avg', k=10, workers=1):
     root_state = mdp.initial_state()
     history = []
     step = 0
@@ -560,13 +736,20 @@ def combination_plan(mdp: "up.engines.MDP", split_mdp: "up.engines.MDP", steps:
         print(f"started step {step}")
 
         mcts = MCTS(mdp, split_mdp, root_node, root_state, search_depth, exploration_constant, selection_type, k)
-        action = mcts.search(search_time, selection_type)
+        action = mcts.search(search_time, selection_type, workers)
 
         print(f"Current state is {root_state}")
         print(f"The chosen action is {action.name}")
 
         terminal, root_state, reward = mcts.mdp.step(root_state, action)
 
+        # The search continues from the subtree of the reached state, its statistics are kept.
+        # The trees of parallel workers are not sent back, then there is no subtree to continue from
+        root_node = mcts.root_node.children[action].children.get(root_state) if workers == 1 else None
+        if root_node is not None:
+            root_node.set_parent(None)
+            root_node.set_depth(0)
+
         history.append(action)
         print(f'current time = {root_state.current_time}')
 
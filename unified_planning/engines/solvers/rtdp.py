@@ -12,6 +12,7 @@ class RTDP:
         self.Q = {}
         self.current_time = 0
         self.split_mdp = split_mdp
+        self._trpg = up.engines.heuristics.TRPG_Compiled(split_mdp)
 
     @property
     def mdp(self):
@@ -112,8 +113,7 @@ class RTDP:
         current_time = 0
         if isinstance(state, up.engines.CombinationState):
             current_time = state.current_time
-        h = up.engines.heuristics.TRPG(self.split_mdp, state, current_time)
-        return h.get_heuristic()
+        return self._trpg.evaluate(state, current_time)
 
 
 def plan(mdp: "up.engines.MDP", split_mdp: "up.engines.MDP", steps: int, search_time: int, search_depth: int):
@@ -1,19 +1,39 @@
 import unified_planning as up
-from typing import Tuple, List, Set
+from typing import Tuple, List, Set, Sequence
 
 import numpy as np
 
 
 class State(up.model.state.ROState):
-    def __init__(self, predicates: Set["up.model.fnode.Fnode"] = None):
-        self._predicates = predicates if predicates else set()
+    """
+    A state is given either by its `predicates` or by `bits`, a bitmask over the ground fluents of the problem
+    where the fluent of bit i is `fluents[i]`. In the latter case the predicates are decoded only when needed.
+    States of the two kinds hash differently, so a state given by predicates never equals a state given by bits.
+    """
+    __slots__ = ('_bits', '_fluents', '_predicates')
+
+    def __init__(self, predicates: Set["up.model.fnode.Fnode"] = None, bits: int = None,
+                 fluents: Sequence["up.model.fnode.Fnode"] = None):
+        self._bits = bits
+        self._fluents = fluents
+        if bits is None:
+            self._predicates = predicates if predicates else set()
+        else:
+            self._predicates = None
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if isinstance(other, State):
-            return self.predicates == other.predicates
+            if self._bits is not None and other._bits is not None:
+                return self._bits == other._bits
+            if self._bits is None and other._bits is None:
+                return self._predicates == other._predicates
         return False
 
     def __hash__(self):
+        if self._bits is not None:
+            return hash(self._bits)
         res = hash("")
         for p in self._predicates:
             res += hash(p)
@@ -29,31 +49,49 @@ class State(up.model.state.ROState):
 
     @property
     def predicates(self):
+        if self._predicates is None:
+            self._predicates = decode_bits(self._bits, self._fluents)
         return self._predicates
 
+    @property
+    def bits(self):
+        return self._bits
+
     def set_predicates(self, new_predicates: Set):
         self._predicates = new_predicates
+        self._bits = None
 
     def get_value(self):
         return 0
 
 
+def decode_bits(bits: int, fluents: Sequence["up.model.fnode.Fnode"]) -> Set["up.model.fnode.Fnode"]:
+    """ Returns the set of fluents whose bit is on in `bits` """
+    predicates = set()
+    while bits:
+        low = bits & -bits
+        predicates.add(fluents[low.bit_length() - 1])
+        bits ^= low
+    return predicates
+
+
 class CombinationState(State):
-    def __init__(self, predicates: Set["up.model.fnode.Fnode"] = None, active_actions: "up.engines.ActionQueue" = None, current_time: int = None):
-        super().__init__(predicates)
+    __slots__ = ('_active_actions', '_current_time')
+
+    def __init__(self, predicates: Set["up.model.fnode.Fnode"] = None, active_actions: "up.engines.ActionQueue" = None,
+                 current_time: int = None, bits: int = None, fluents: Sequence["up.model.fnode.Fnode"] = None):
+        super().__init__(predicates, bits, fluents)
         self._active_actions = active_actions if active_actions else ActionQueue()
         self._current_time = current_time if current_time else 0
 
     def __eq__(self, other):
         if isinstance(other, State):
-            return self.predicates == other.predicates \
+            return super().__eq__(other) \
                 and self.active_actions == other.active_actions
         return False
 
     def __hash__(self):
-        res = hash("")
-        for p in self._predicates:
-            res += hash(p)
+        res = super().__hash__()
         res += hash(self._active_actions)
         return res
 
@@ -100,6 +138,8 @@ import heapq
 
 class QueueNode:
     """ holds action and it's duration left """
+    __slots__ = ('action', 'duration_left')
+
     def __init__(self, action: "up.engines.Action", duration_left: int):
         self.action = action
         self.duration_left = duration_left
@@ -131,20 +171,36 @@ class QueueNode:
 class ActionQueue:
     """
     Actions currently in execution and the remaining duration left for their execution
+
+    The heap keeps the nodes with the duration left at the time the `offset` was 0,
+    so passing time only moves the `offset` and the nodes can be shared between clones.
+    The hash is cached until the queue changes - an action is added or removed, or time passes.
     """
+    __slots__ = ('_heap', '_offset', '_hash')
+
     def __init__(self):
-        self.data = []
+        self._heap: List[QueueNode] = []
+        self._offset = 0
+        self._hash = None
 
     def __eq__(self, other):
         if isinstance(other, ActionQueue):
-            return self.data == other.data
+            if len(self._heap) != len(other._heap):
+                return False
+            if self._hash is not None and other._hash is not None and self._hash != other._hash:
+                return False
+            return all((node.action is other_node.action or node.action == other_node.action) and
+                       node.duration_left - self._offset == other_node.duration_left - other._offset
+                       for node, other_node in zip(self._heap, other._heap))
         return False
 
     def __hash__(self):
-        res = hash("")
-        for node in self.data:
-            res += hash(node)
-        return res
+        if self._hash is None:
+            res = hash("")
+            for node in self._heap:
+                res += hash("") + hash(node.action) + hash(node.duration_left - self._offset)
+            self._hash = res
+        return self._hash
 
     def __repr__(self):
         s = []
@@ -155,15 +211,29 @@ class ActionQueue:
         return "".join(s)
 
     def __len__(self):
-        return len(self.data)
+        return len(self._heap)
+
+    @property
+    def data(self):
+        """ The nodes in the queue with their current duration left """
+        return [QueueNode(node.action, node.duration_left - self._offset) for node in self._heap]
 
     def clone(self):
         new_action_queue = ActionQueue()
-        new_action_queue.data = [node.clone() for node in self.data]
+        new_action_queue._heap = list(self._heap)
+        new_action_queue._offset = self._offset
+        new_action_queue._hash = self._hash
         return new_action_queue
 
     def add_action(self, node):
-        heapq.heappush(self.data, node)
+        heapq.heappush(self._heap, QueueNode(node.action, node.duration_left + self._offset))
+        self._hash = None
+
+    def bulk_add(self, nodes: List[QueueNode]):
+        """ Adds all the `nodes` to the queue and restores the heap order once """
+        self._heap.extend(QueueNode(node.action, node.duration_left + self._offset) for node in nodes)
+        heapq.heapify(self._heap)
+        self._hash = None
 
     def get_next_actions(self):
         """
@@ -171,16 +241,18 @@ class ActionQueue:
         There can be several actions that have the same duration left.
         """
         next_actions = []
-        if self.data:
-            min_duration = self.data[0].duration_left
-            while self.data and self.data[0].duration_left == min_duration:
-                node = heapq.heappop(self.data)
+        heap = self._heap
+        if heap:
+            min_key = heap[0].duration_left
+            while heap and heap[0].duration_left == min_key:
+                node = heapq.heappop(heap)
                 next_actions.append(node.action)
-            return min_duration, next_actions
+            self._hash = None
+            return min_key - self._offset, next_actions
         else:
             return -1, []
 
     def update_delta(self, delta: int):
-        """ Extract delta from each of the actions in data: duration_left = duration_left - delta """
-        for i in range(len(self.data)):
-            self.data[i].duration_left -= delta
+        """ Extract delta from each of the actions in data: duration_left = duration_left - delta, in O(1) """
+        self._offset += delta
+        self._hash = None
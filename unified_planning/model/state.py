@@ -7,6 +7,7 @@ from unified_planning.exceptions import UPUsageError, UPValueError
 
 class ROState:
     """This is an abstract class representing a classical `Read Only state`"""
+    __slots__ = ()
 
     def get_value(self, value: "unified_planning.model.FNode") -> "unified_planning.model.FNode":
         """
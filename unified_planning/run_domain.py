@@ -43,10 +43,11 @@ def print_stats():
     print(f'Object Amount = {up.args.object_amount}')
     print(f'Garbage Action Amount = {up.args.garbage_amount}')
     print(f'K Random Actions = {up.args.k}')
+    print(f'Workers = {up.args.workers}')
 
 
 def run_regular(domain, runs, domain_type, deadline, search_time, search_depth, exploration_constant, object_amount, garbage_amount,
-                selection_type='avg', k=10):
+                selection_type='avg', k=10, workers=1):
     """
     Run split action to start and end actions logic - TP-MCTS approach
     """
@@ -80,7 +81,7 @@ def run_regular(domain, runs, domain_type, deadline, search_time, search_depth,
 
     mdp = MDP(converted_problem, discount_factor=0.95)
 
-    params = (mdp, 90, search_time, search_depth, exploration_constant, selection_type, k)
+    params = (mdp, 90, search_time, search_depth, exploration_constant, selection_type, k, workers)
     up.engines.solvers.evaluate.evaluation_loop(runs, up.engines.solvers.mcts.plan, params)
 
 
@@ -106,7 +107,7 @@ def create_combination_domain(domain, deadline, object_amount, garbage_amount):
 
 
 def run_combination(domain, runs, solver, deadline, search_time, search_depth, exploration_constant, object_amount, garbage_amount,
-                    selection_type='avg', k=10):
+                    selection_type='avg', k=10, workers=1):
     """
     Run the combination logic - Mausem and Weld approach
     """
@@ -149,7 +150,7 @@ def run_combination(domain, runs, solver, deadline, search_time, search_depth, e
         up.engines.solvers.evaluate.evaluation_loop(runs, up.engines.solvers.rtdp.plan, params)
 
     else:
-        params = (mdp, split_mdp, 90, search_time, search_depth, exploration_constant, selection_type, k)
+        params = (mdp, split_mdp, 90, search_time, search_depth, exploration_constant, selection_type, k, workers)
         up.engines.solvers.evaluate.evaluation_loop(runs, up.engines.solvers.mcts.combination_plan, params)
 
 
@@ -159,9 +160,11 @@ if up.args.domain_type == 'combination':
     run_combination(domain=up.args.domain, runs=up.args.runs, solver=up.args.solver, deadline=up.args.deadline,
                     search_time=up.args.search_time,
                     search_depth=up.args.search_depth, exploration_constant=up.args.exploration_constant,
-                    selection_type=up.args.selection_type, object_amount=up.args.object_amount, garbage_amount=up.args.garbage_amount, k=up.args.k)
+                    selection_type=up.args.selection_type, object_amount=up.args.object_amount, garbage_amount=up.args.garbage_amount, k=up.args.k,
+                    workers=up.args.workers)
 else:
     run_regular(domain=up.args.domain, domain_type=up.args.domain_type, runs=up.args.runs, deadline=up.args.deadline,
                 search_time=up.args.search_time,
                 search_depth=up.args.search_depth, exploration_constant=up.args.exploration_constant,
-                selection_type=up.args.selection_type, object_amount=up.args.object_amount, garbage_amount=up.args.garbage_amount, k=up.args.k)
+                selection_type=up.args.selection_type, object_amount=up.args.object_amount, garbage_amount=up.args.garbage_amount, k=up.args.k,
+                workers=up.args.workers)
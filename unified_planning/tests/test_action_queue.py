@@ -0,0 +1,43 @@
+import unified_planning as up
+from unified_planning.shortcuts import *
+import unittest
+
+from unified_planning.tests import combination_converted_problem
+
+
+class Test_Action_Queue(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.x, cls.y = combination_converted_problem.actions[:2]
+
+    def queue(self, *nodes):
+        action_queue = up.engines.ActionQueue()
+        for action, duration_left in nodes:
+            action_queue.add_action(up.engines.QueueNode(action, duration_left))
+        return action_queue
+
+    def test_equal_after_time_passes(self):
+        print("Running test_equal_after_time_passes...")
+
+        action_queue = self.queue((self.x, 5), (self.y, 7))
+        hash(action_queue)
+        action_queue.update_delta(2)
+        expected = self.queue((self.x, 3), (self.y, 5))
+
+        self.assertEqual(action_queue, expected, 'the queues hold the same durations left')
+        self.assertEqual(hash(action_queue), hash(expected), 'equal queues have the same hash')
+
+    def test_not_equal_after_time_passes(self):
+        print("Running test_not_equal_after_time_passes...")
+
+        action_queue = self.queue((self.x, 5), (self.y, 7))
+        other = action_queue.clone()
+        hash(action_queue)
+        hash(other)
+        other.update_delta(1)
+
+        self.assertNotEqual(action_queue, other, 'time passed only in one of the queues')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unified_planning
+from unified_planning.shortcuts import *
+import unittest
+from unified_planning.tests import mutex_converted_problem
+from unified_planning.engines.solvers.mcts import _merge_root_statistics, _best_action
+
+
+class TestMCTS(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.mdp = unified_planning.engines.MDP(mutex_converted_problem, discount_factor=0.95)
+
+    def test_merge_root_statistics(self):
+        print("Running test_merge_root_statistics...")
+
+        state = self.mdp.initial_state()
+        root_node = up.engines.SNode(state, 0, self.mdp.legal_actions(state))
+        first, second, third = root_node.possible_actions[:3]
+
+        # the first action is better in the first worker, but the second is better on average
+        results = [{first.name: (2.0, 1), second.name: (1.0, 3)},
+                   {first.name: (0.0, 3), second.name: (2.0, 1)}]
+        counts, values = _merge_root_statistics(root_node, results)
+
+        self.assertEqual(list(counts[:3]), [4, 4, 0], 'the visits of the workers are summed')
+        self.assertEqual(list(values[:2]), [0.5, 1.25], 'the values are averaged by the visits')
+        self.assertEqual(_best_action(root_node.possible_actions, counts, values), second,
+                         'an action that was not visited is not chosen')
+
+
+if __name__ == '__main__':
+    unittest.main()
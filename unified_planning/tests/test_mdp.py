@@ -40,6 +40,40 @@ class TestMDP(unittest.TestCase):
 
         self.assertTrue(next_state2 in legal)
 
+    def test_state_bits(self):
+        print("Running test_state_bits...")
+
+        delete_init = self.converted_problem.action_by_name("delete_init")
+        init = self.converted_problem.fluent_by_name("init")
+
+        state = self.mdp.initial_state()
+        _, next_state, _ = self.mdp.step(state, delete_init)
+
+        self.assertTrue(init() in state.predicates, 'init holds in the initial state')
+        self.assertFalse(init() in next_state.predicates, 'delete_init removes init')
+        self.assertEqual(next_state.bits, state.bits & ~delete_init.del_mask)
+
+    def test_equal_states_are_interned(self):
+        print("Running test_equal_states_are_interned...")
+
+        delete_init = self.converted_problem.action_by_name("delete_init")
+        add_init = self.converted_problem.action_by_name("add_init")
+
+        _, next_state, _ = self.mdp.step(self.mdp.initial_state(), delete_init)
+        _, next_state, _ = self.mdp.step(next_state, add_init)
+
+        self.assertIs(next_state, self.mdp.initial_state())
+
+    def test_states_of_different_kinds_are_not_equal(self):
+        print("Running test_states_of_different_kinds_are_not_equal...")
+
+        state = self.mdp.initial_state()
+        predicates_state = up.engines.State(set(state.predicates))
+
+        self.assertEqual(predicates_state, up.engines.State(set(state.predicates)))
+        self.assertNotEqual(predicates_state, state, 'states given by predicates and by bits hash differently')
+        self.assertEqual(len({state, predicates_state}), 2)
+
 
 
 if __name__ == '__main__':
@@ -47,6 +47,45 @@ class TestNode(unittest.TestCase):
 
         self.assertFalse(self.stn.is_consistent(), 'Long action cannot end before the short action')
 
+    def test_uct_prefers_not_visited(self):
+        print("Running test_uct_prefers_not_visited...")
+
+        state = self.mdp.initial_state()
+        snode = up.engines.SNode(state, 0, self.mdp.legal_actions(state))
+        first, second = snode.possible_actions[:2]
+
+        snode.children[first].update(1)
+        snode.update(1)
+
+        self.assertEqual(snode.uct(1), second, 'an action that was not visited is selected first')
+        self.assertEqual(snode.max_update(), snode.children[first].value)
+
+    def test_best_action_is_visited(self):
+        print("Running test_best_action_is_visited...")
+
+        state = self.mdp.initial_state()
+        snode = up.engines.SNode(state, 0, self.mdp.legal_actions(state))
+        self.assertEqual(snode.best_action(), -1, 'no action was visited')
+
+        first, second = snode.possible_actions[:2]
+        snode.children[first].update(-1)
+        snode.children[second].update(-2)
+
+        self.assertEqual(snode.best_action(), first, 'the action with the highest value is the best')
+
+    def test_remove_action_keeps_order(self):
+        print("Running test_remove_action_keeps_order...")
+
+        state = self.mdp.initial_state()
+        snode = up.engines.C_SNode(state, 0, self.mdp.legal_actions(state), create_init_stn(self.mdp))
+        first, second, third = snode.possible_actions[:3]
+        snode.children[third].update(1)
+
+        snode.remove_action(first)
+
+        self.assertEqual(snode.possible_actions[:2], (second, third), 'the order of the actions is kept')
+        self.assertEqual(snode.best_action(), third, 'the statistics follow the actions')
+
 
 if __name__ == '__main__':
     unittest.main()